@@ -0,0 +1,172 @@
+/*
+Author: Rashi Sinha
+Date Created: 20 July 2024
+Versio: 1.0
+
+Description: Optional native kernel for gerstnerWaveDeformer.py.
+It evaluates the 3 gerstner waves for 8 points at a time with AVX2/FMA,
+using a vectorized sin/cos pair (Cephes polynomial approximation, as in avx_mathfun),
+and falls back to plain C for the remaining points or when built without AVX2.
+When built with OpenMP, the points are split across all CPU cores.
+
+The plugin loads the library with ctypes if it is found next to gerstnerWaveDeformer.py,
+no Python headers are needed to build it. ctypes releases the GIL during the call.
+
+Build:
+    Linux:   gcc -O3 -mavx2 -mfma -fopenmp -fPIC -shared gerstnerSimd.c -o gerstnerSimd.so -lm
+    macOS:   clang -O3 -mavx2 -mfma -dynamiclib gerstnerSimd.c -o gerstnerSimd.dylib
+             (add -Xpreprocessor -fopenmp -lomp for OpenMP with Homebrew's libomp)
+    Windows: cl /O2 /arch:AVX2 /openmp /LD gerstnerSimd.c /Fe:gerstnerSimd.dll
+*/
+
+#include <math.h>
+
+#if defined(__AVX2__) && (defined(__FMA__) || defined(_MSC_VER))
+#include <immintrin.h>
+#define GERSTNER_AVX2 1
+#endif
+
+#ifdef _WIN32
+#define GERSTNER_EXPORT __declspec(dllexport)
+#else
+#define GERSTNER_EXPORT
+#endif
+
+/* number of floats per wave in the params array */
+#define GERSTNER_WAVE_PARAMS 6
+
+/* meshes with fewer points are evaluated on the calling thread, starting threads would cost more */
+#define GERSTNER_PARALLEL_MIN_POINTS 8192
+
+
+#ifdef GERSTNER_AVX2
+
+/* sin and cos of 8 floats at once, Cephes sinf/cosf range reduction and polynomials */
+static inline void sincos256(__m256 x, __m256 *s, __m256 *c)
+{
+    const __m256 signMask = _mm256_castsi256_ps(_mm256_set1_epi32((int)0x80000000));
+
+    /* work on |x|, keep the sign for sin */
+    __m256 signBitSin = _mm256_and_ps(x, signMask);
+    x = _mm256_andnot_ps(signMask, x);
+
+    /* octant of x: j = (int)(x * 4/pi), rounded up to an even number */
+    __m256 y = _mm256_mul_ps(x, _mm256_set1_ps(1.27323954473516f));
+    __m256i j = _mm256_cvttps_epi32(y);
+    j = _mm256_add_epi32(j, _mm256_set1_epi32(1));
+    j = _mm256_and_si256(j, _mm256_set1_epi32(~1));
+    y = _mm256_cvtepi32_ps(j);
+
+    __m256 swapSignBitSin = _mm256_castsi256_ps(_mm256_slli_epi32(_mm256_and_si256(j, _mm256_set1_epi32(4)), 29));
+    __m256 polyMask = _mm256_castsi256_ps(_mm256_cmpeq_epi32(_mm256_and_si256(j, _mm256_set1_epi32(2)), _mm256_setzero_si256()));
+    __m256i jCos = _mm256_andnot_si256(_mm256_sub_epi32(j, _mm256_set1_epi32(2)), _mm256_set1_epi32(4));
+    __m256 signBitCos = _mm256_castsi256_ps(_mm256_slli_epi32(jCos, 29));
+    signBitSin = _mm256_xor_ps(signBitSin, swapSignBitSin);
+
+    /* extended precision modular arithmetic: x = ((x - y * DP1) - y * DP2) - y * DP3 */
+    x = _mm256_fmadd_ps(y, _mm256_set1_ps(-0.78515625f), x);
+    x = _mm256_fmadd_ps(y, _mm256_set1_ps(-2.4187564849853515625e-4f), x);
+    x = _mm256_fmadd_ps(y, _mm256_set1_ps(-3.77489497744594108e-8f), x);
+
+    __m256 z = _mm256_mul_ps(x, x);
+
+    /* cos polynomial, valid on the first octant */
+    __m256 yc = _mm256_set1_ps(2.443315711809948e-5f);
+    yc = _mm256_fmadd_ps(yc, z, _mm256_set1_ps(-1.388731625493765e-3f));
+    yc = _mm256_fmadd_ps(yc, z, _mm256_set1_ps(4.166664568298827e-2f));
+    yc = _mm256_mul_ps(_mm256_mul_ps(yc, z), z);
+    yc = _mm256_fnmadd_ps(_mm256_set1_ps(0.5f), z, yc);
+    yc = _mm256_add_ps(yc, _mm256_set1_ps(1.0f));
+
+    /* sin polynomial, valid on the first octant */
+    __m256 ys = _mm256_set1_ps(-1.9515295891e-4f);
+    ys = _mm256_fmadd_ps(ys, z, _mm256_set1_ps(8.3321608736e-3f));
+    ys = _mm256_fmadd_ps(ys, z, _mm256_set1_ps(-1.6666654611e-1f));
+    ys = _mm256_mul_ps(_mm256_mul_ps(ys, z), x);
+    ys = _mm256_add_ps(ys, x);
+
+    /* pick the polynomial matching each octant */
+    __m256 sinVal = _mm256_blendv_ps(yc, ys, polyMask);
+    __m256 cosVal = _mm256_blendv_ps(ys, yc, polyMask);
+
+    *s = _mm256_xor_ps(sinVal, signBitSin);
+    *c = _mm256_xor_ps(cosVal, signBitCos);
+}
+
+#endif
+
+
+/*
+Evaluate the 3 gerstner waves for n points, writing the displacement of each point.
+
+Parameters:
+xs, zs (float*): x and z coordinates of the points
+offsetX, offsetY, offsetZ (float*): displacement of each point (output)
+n (int): number of points
+params (float[3][6]): per wave k*dx, k*dy, k*c*movement, envelope*a*dx, envelope*a, envelope*a*dy
+*/
+GERSTNER_EXPORT void gerstnerApplyWaves(const float *xs, const float *zs,
+                                        float *offsetX, float *offsetY, float *offsetZ,
+                                        int n, const float *params)
+{
+    int tail = 0;
+
+#ifdef GERSTNER_AVX2
+    int numBlocks = n / 8;
+    __m256 kdx[3], kdy[3], phase[3], ax[3], ay[3], az[3];
+    for (int w = 0; w < 3; w++) {
+        const float *p = params + w * GERSTNER_WAVE_PARAMS;
+        kdx[w] = _mm256_set1_ps(p[0]);
+        kdy[w] = _mm256_set1_ps(p[1]);
+        phase[w] = _mm256_set1_ps(p[2]);
+        ax[w] = _mm256_set1_ps(p[3]);
+        ay[w] = _mm256_set1_ps(p[4]);
+        az[w] = _mm256_set1_ps(p[5]);
+    }
+
+    /* blocks of 8 points are independent, split them across threads (only reads shared data) */
+    #pragma omp parallel for schedule(static) if (n >= GERSTNER_PARALLEL_MIN_POINTS)
+    for (int b = 0; b < numBlocks; b++) {
+        int i = b * 8;
+        __m256 x = _mm256_loadu_ps(xs + i);
+        __m256 z = _mm256_loadu_ps(zs + i);
+        __m256 ox = _mm256_setzero_ps();
+        __m256 oy = _mm256_setzero_ps();
+        __m256 oz = _mm256_setzero_ps();
+
+        for (int w = 0; w < 3; w++) {
+            __m256 sf, cf;
+            __m256 f = _mm256_fmadd_ps(kdx[w], x, _mm256_fmsub_ps(kdy[w], z, phase[w]));
+            sincos256(f, &sf, &cf);
+            ox = _mm256_fmadd_ps(ax[w], cf, ox);
+            oy = _mm256_fmadd_ps(ay[w], sf, oy);
+            oz = _mm256_fmadd_ps(az[w], cf, oz);
+        }
+
+        _mm256_storeu_ps(offsetX + i, ox);
+        _mm256_storeu_ps(offsetY + i, oy);
+        _mm256_storeu_ps(offsetZ + i, oz);
+    }
+
+    tail = numBlocks * 8;
+#endif
+
+    /* remaining points (or all of them without AVX2) */
+    #pragma omp parallel for schedule(static) if (n - tail >= GERSTNER_PARALLEL_MIN_POINTS)
+    for (int i = tail; i < n; i++) {
+        float ox = 0.0f, oy = 0.0f, oz = 0.0f;
+
+        for (int w = 0; w < 3; w++) {
+            const float *p = params + w * GERSTNER_WAVE_PARAMS;
+            float f = p[0] * xs[i] + p[1] * zs[i] - p[2];
+            float cf = cosf(f);
+            ox += p[3] * cf;
+            oy += p[4] * sinf(f);
+            oz += p[5] * cf;
+        }
+
+        offsetX[i] = ox;
+        offsetY[i] = oy;
+        offsetZ[i] = oz;
+    }
+}
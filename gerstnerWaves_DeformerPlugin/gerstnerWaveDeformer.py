@@ -12,6 +12,16 @@ Gerstner Wave Algorithm Reference: https://catlikecoding.com/unity/tutorials/flo
 
 This can be used to depict water surfaces.
 
+Performance: When NumPy is available (bundled with Maya 2022+), all vertex positions
+are read in bulk and the 3 waves are evaluated as vectorized array operations.
+If the native gerstnerSimd library (gerstnerSimd.c, see the build notes in that file) is built
+next to this plugin, the 3 waves are evaluated with AVX2, 8 points at a time. Otherwise,
+if Numba is installed, they are evaluated by a single compiled loop over the points.
+Both split meshes of parallelMinPoints points or more across all CPU cores.
+With the GERSTNER_WAVE_GPU environment variable set to 1 and CuPy installed, meshes of
+gpuMinPoints points or more are evaluated on the GPU instead.
+Without NumPy, the plugin falls back to evaluating the waves vertex by vertex.
+
 Inputs: Movement Factor, Wave Direction, Steepness, 
 and Wavelength for 3 Waves (A, B, C)
 
@@ -19,15 +29,279 @@ Ouput: Deformed Mesh Geometry
 """
 
 import sys
+import os
+import ctypes
 import maya.OpenMaya as om
 import maya.OpenMayaMPx as omMPx
 import maya.OpenMayaAnim as omA
 import math
 
+# NumPy is optional, deform() falls back to the per-vertex Python path without it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Numba is optional, the NumPy path is used without it
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# CuPy is optional, it is only imported when the GPU path is enabled, as importing it initializes CUDA
+cupy = None
+if os.environ.get("GERSTNER_WAVE_GPU") == "1":
+    try:
+        import cupy
+    except ImportError:
+        sys.stderr.write("GERSTNER_WAVE_GPU is set but CuPy is not installed, using the CPU implementation.\n")
+
 
 nodeName = "GerstnerWaveDeformer"
 nodeId = om.MTypeId(0x106fff)
 
+# number of points gerstnerWavesNumPy() evaluates all 3 waves for before moving on, sized to stay in cache
+numpyBlockSize = 4096
+
+# maximum number of entries in Ripple.waveConstantsCache before it is cleared
+waveConstantsCacheSize = 64
+
+# meshes with fewer points are evaluated on a single thread, starting threads would cost more
+parallelMinPoints = 8192
+
+# meshes with fewer points are evaluated on the CPU, uploading them to the GPU and back would cost more
+gpuMinPoints = 100000
+
+# threads per block of the GPU kernel
+gpuBlockSize = 256
+
+
+def waveConstants(wave, wavelength):
+
+    '''
+    Function to calculate the per-wave values of the gerstner wave formula
+    that do not depend on the vertex position.
+
+    Parameters:
+    Wave (float3): Wave Direction X, Wave Direction Y, Steepness (Deformer Node custom Input Attribute)
+    Wavelength (float): Wavelength of the wave (Deformer Node custom Input Attribute)
+
+    Returns:
+    (k, c, a, dx, dy): wave number, phase speed, amplitude and normalized wave direction
+    '''
+
+    k = 2 * math.pi / wavelength
+    c = math.sqrt(9.8 / k)
+    a = wave[2] / k
+
+    # normalize the direction, a zero direction (attribute default) stays zero like MFloatVector.normal()
+    lengthSquared = wave[0] * wave[0] + wave[1] * wave[1]
+    if lengthSquared == 0.0:
+        return k, c, a, 0.0, 0.0
+    invLength = 1.0 / math.sqrt(lengthSquared)
+    return k, c, a, wave[0] * invLength, wave[1] * invLength
+
+
+def waveParams(constants, movementVal, envelopeVal):
+
+    '''
+    Function to fold the movement factor and envelope into the waveConstants() values,
+    so evaluating a wave for a point takes only multiply-adds besides the cos and sin.
+
+    Parameters:
+    constants (tuple): waveConstants() result of the wave
+    movementVal (float): movement factor to move the waves (Deformer Node custom Input Attribute)
+    envelopeVal (float): Deformer node blend/affect value
+
+    Returns:
+    (k*dx, k*dy, k*c*movement, envelope*a*dx, envelope*a, envelope*a*dy)
+    '''
+
+    k, c, a, dx, dy = constants
+    amplitude = envelopeVal * a
+    return k * dx, k * dy, k * c * movementVal, amplitude * dx, amplitude, amplitude * dy
+
+
+def pointArrayBuffer(length):
+
+    '''
+    Function to allocate a double4 buffer that can be filled from, or used to build, an MPointArray,
+    together with a NumPy (length, 4) view of the same memory.
+
+    Parameters:
+    length (int): Number of points in the buffer
+
+    Returns:
+    (MScriptUtil, double4 pointer, numpy.ndarray): the MScriptUtil owns the memory and must be kept alive
+    while the pointer or the view are in use.
+    '''
+
+    mScriptUtil = om.MScriptUtil()
+    mScriptUtil.createFromList([0.0] * (4 * length), 4 * length)
+    pointsPtr = mScriptUtil.asDouble4Ptr()
+    pointsView = np.ctypeslib.as_array((ctypes.c_double * (4 * length)).from_address(int(pointsPtr)))
+    return mScriptUtil, pointsPtr, pointsView.reshape(length, 4)
+
+
+def gerstnerWavesNumPy(xs, zs, params, offsetX, offsetY, offsetZ):
+
+    '''
+    Function evaluating the 3 gerstner waves with NumPy. The points are processed in blocks,
+    and all 3 waves are evaluated for a block while its x and z values are still in cache.
+
+    Parameters:
+    xs, zs (float32 array): x and z coordinates of the points
+    params (float32 array): (3, 6) array with the waveParams() values of the 3 waves
+    offsetX, offsetY, offsetZ (float32 array): displacement of each point, zero initialized (implicit return)
+    '''
+
+    # all temporaries are float32 like the inputs, NumPy would otherwise promote to float64
+    f = np.empty(min(numpyBlockSize, xs.shape[0]), dtype=np.float32)
+    waveTerm = np.empty_like(f)
+
+    for start in range(0, xs.shape[0], numpyBlockSize):
+        end = min(start + numpyBlockSize, xs.shape[0])
+        x = xs[start:end]
+        z = zs[start:end]
+        ox = offsetX[start:end]
+        oy = offsetY[start:end]
+        oz = offsetZ[start:end]
+        fBlock = f[:end - start]
+        term = waveTerm[:end - start]
+
+        # the rows are float32, so are the scalars taken from them
+        for kdx, kdy, phase, ax, ay, az in params:
+            np.multiply(x, kdx, out=fBlock)
+            np.multiply(z, kdy, out=term)
+            fBlock += term
+            fBlock -= phase
+            np.sin(fBlock, out=term)
+            term *= ay
+            oy += term
+            np.cos(fBlock, out=fBlock)
+            np.multiply(fBlock, ax, out=term)
+            ox += term
+            fBlock *= az
+            oz += fBlock
+
+
+if numba is not None:
+
+    @numba.njit(cache=True, fastmath=True, parallel=True)
+    def applyThreeWaves(xs, zs, params, offsetX, offsetY, offsetZ):
+
+        '''
+        Compiled kernel evaluating the 3 gerstner waves for all points in a single pass,
+        split across all CPU cores. Every point is independent, and the kernel only writes
+        its own arrays, so it is safe to run from Maya's evaluation threads.
+
+        Parameters:
+        xs, zs (float32 array): x and z coordinates of the points
+        params (float32 array): (3, 6) array with the waveParams() values of the 3 waves
+        offsetX, offsetY, offsetZ (float32 array): displacement of each point (implicit return)
+        '''
+
+        for i in numba.prange(xs.shape[0]):
+            x = xs[i]
+            z = zs[i]
+            # float32 accumulators, a Python float literal would make the whole loop float64
+            ox = np.float32(0.0)
+            oy = np.float32(0.0)
+            oz = np.float32(0.0)
+            for w in range(3):
+                f = params[w, 0] * x + params[w, 1] * z - params[w, 2]
+                cf = math.cos(f)
+                ox += params[w, 3] * cf
+                oy += params[w, 4] * math.sin(f)
+                oz += params[w, 5] * cf
+            offsetX[i] = ox
+            offsetY[i] = oy
+            offsetZ[i] = oz
+
+    # same kernel on the calling thread (prange runs as range), for meshes below parallelMinPoints.
+    # Not cached, so it can not collide with the cache entry of the parallel version.
+    applyThreeWavesSerial = numba.njit(fastmath=True)(applyThreeWaves.py_func)
+
+else:
+    applyThreeWaves = None
+    applyThreeWavesSerial = None
+
+
+def loadSimdLibrary():
+
+    '''
+    Function to load the optional native gerstnerSimd library from the plugin's folder.
+
+    Returns:
+    ctypes.CDLL or None if the library was not built for this platform or could not be loaded.
+    '''
+
+    if np is None or "__file__" not in globals():
+        return None
+
+    if sys.platform.startswith("win"):
+        libraryName = "gerstnerSimd.dll"
+    elif sys.platform == "darwin":
+        libraryName = "gerstnerSimd.dylib"
+    else:
+        libraryName = "gerstnerSimd.so"
+
+    libraryPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), libraryName)
+    if not os.path.exists(libraryPath):
+        return None
+
+    try:
+        library = ctypes.CDLL(libraryPath)
+    except OSError:
+        sys.stderr.write("Failed to load " + libraryPath + ", using the Python implementation.\n")
+        return None
+
+    # gerstnerApplyWaves(xs, zs, offsetX, offsetY, offsetZ, n, params)
+    library.gerstnerApplyWaves.restype = None
+    library.gerstnerApplyWaves.argtypes = [ctypes.c_void_p] * 5 + [ctypes.c_int, ctypes.c_void_p]
+    return library
+
+
+gerstnerSimd = loadSimdLibrary()
+
+
+def loadGpuKernel():
+
+    '''
+    Function to build the optional CuPy kernel evaluating the 3 gerstner waves on the GPU,
+    one thread per point, with the same math as the native kernel.
+
+    Returns:
+    cupy.ElementwiseKernel or None if the GPU path is not enabled or CuPy is not available.
+    '''
+
+    if np is None or cupy is None:
+        return None
+
+    # params (float[3][6]): per wave k*dx, k*dy, k*c*movement, envelope*a*dx, envelope*a, envelope*a*dy
+    return cupy.ElementwiseKernel(
+        "float32 x, float32 z, raw float32 params",
+        "float32 offsetX, float32 offsetY, float32 offsetZ",
+        '''
+        float ox = 0.0f, oy = 0.0f, oz = 0.0f;
+        for (int w = 0; w < 3; w++) {
+            const float *p = &params[w * 6];
+            float sf, cf;
+            sincosf(p[0] * x + p[1] * z - p[2], &sf, &cf);
+            ox += p[3] * cf;
+            oy += p[4] * sf;
+            oz += p[5] * cf;
+        }
+        offsetX = ox;
+        offsetY = oy;
+        offsetZ = oz;
+        ''',
+        "gerstnerApplyWavesGpu")
+
+
+gerstnerGpu = loadGpuKernel()
+
+
 class Ripple(omMPx.MPxDeformerNode):
 
     # deforme Node custon Input Attributes
@@ -42,64 +316,139 @@ class Ripple(omMPx.MPxDeformerNode):
     mObj_inWaveC_DirSteep = om.MObject()
     mObj_inWaveC_Wavelength = om.MObject()
 
+    # waveConstants() results keyed on (Wave Direction X, Wave Direction Y, Steepness, Wavelength),
+    # so only the movement factor changing (animating the waves) does not recompute them
+    waveConstantsCache = {}
+
 
     def __init__(self):
         omMPx.MPxDeformerNode.__init__(self)
 
-    def gerstnerWave(self, wave, wavelength, position, movementVal):
+    def gerstnerWave(self, px, pz, kdx, kdy, phase, ax, ay, az):
 
         '''
         Method to caculate the current point's position displacement 
         for one gerstner wave 
 
         Parameters:
-        Wave (float3): Wave Direction X, Wave Direction Y, Steepness (Deformer Node custom Input Attribute)
-        Wavelength (float): Wavelength of the wave (Deformer Node custom Input Attribute)
-        poisition (MPoint): Current vertex's position (inputGeom information)
-        movementVal (float): movement factor to move the waves (Deformer Node custom Input Attribute)
+        px, pz (float): Current vertex's x and z position (inputGeom information)
+        kdx, kdy, phase, ax, ay, az (float): waveParams() values of the wave
 
+        Returns:
+        (float, float, float): displacement of the point, scaled by the envelope
         '''
         
-        steepness = wave[2]
-        k = float(2 * math.pi / wavelength)
-        c = float(math.sqrt(9.8 / k))
-        floatVectorDirection = om.MFloatVector(wave[0], wave[1])
-        d = floatVectorDirection.normal()
-        dotDirectionPositon = (d.x * position.x) + (d.y * position.z)
-        f = k * (dotDirectionPositon - c * movementVal)
-        a = steepness / k
+        f = kdx * px + kdy * pz - phase
 
         # tangent and binormal formula for calculating the updated normal of a point
         # Not needed as Maya updates the normals, and this is a deformer node, and not a shader.
         # tangent += float3(
-        #     -d.x * d.x * (steepness * sin(f)),
-        #     d.x * (steepness * cos(f)),
-        #     -d.x * d.y * (steepness * sin(f))
+        #     -dx * dx * (steepness * sin(f)),
+        #     dx * (steepness * cos(f)),
+        #     -dx * dy * (steepness * sin(f))
         # )
         # binormal += float3(
-        #     -d.x * d.y * (steepness * sin(f)),
-        #     d.y * (steepness * cos(f)),
-        #     -d.y * d.y * (steepness * sin(f))
+        #     -dx * dy * (steepness * sin(f)),
+        #     dy * (steepness * cos(f)),
+        #     -dy * dy * (steepness * sin(f))
         # )
         
-        pointPosition = om.MPoint((d.x * (a * math.cos(f))),(a * math.sin(f)),(d.y * (a * math.cos(f))))
-        return pointPosition
+        cf = math.cos(f)
+        return ax * cf, ay * math.sin(f), az * cf
     
 
-    def addToPosition(self, pointPosition, pointToAdd, evaluateVal):
+    def cachedWaveConstants(self, wave, wavelength):
+
+        '''
+        Method returning waveConstants() for the wave attribute values, computed only when the values change
+
+        Parameters:
+        Wave (float3): Wave Direction X, Wave Direction Y, Steepness (Deformer Node custom Input Attribute)
+        Wavelength (float): Wavelength of the wave (Deformer Node custom Input Attribute)
+        '''
+
+        key = (wave[0], wave[1], wave[2], wavelength)
+        constants = Ripple.waveConstantsCache.get(key)
+        if constants is None:
+            # keep the cache small when the wave attributes themselves are animated
+            if len(Ripple.waveConstantsCache) >= waveConstantsCacheSize:
+                Ripple.waveConstantsCache.clear()
+            constants = waveConstants(wave, wavelength)
+            Ripple.waveConstantsCache[key] = constants
+        return constants
+
+
+    def deformVectorized(self, geoIterator, inMesh, constants, movementVal, envelopeVal):
 
         """
-        Helper method to add the result from the gerstner wave to the current point position
+        Method to deform all points of the geometry at once, evaluating the gerstner waves
+        on the GPU, with the native or Numba kernel, or as NumPy array operations, instead of one vertex at a time.
 
         Parameters:
-        pointPosition (MPoint): Current vertex's position (inputGeom information)
-        pointToAdd (MPoint): Result of gerstnerWave() method
-        evaluateVal (float): Deformer node blend/affect value
+        geoIterator (MItGeometry): Iterator over the points of the deformed geometry
+        inMesh (MObject): Input geometry of the deformer
+        constants (list): waveConstants() results for each of the 3 waves
+        movementVal (float): movement factor to move the waves (Deformer Node custom Input Attribute)
+        envelopeVal (float): Deformer node blend/affect value
         """
 
-        pointPosition.x = pointPosition.x + pointToAdd.x * evaluateVal
-        pointPosition.y = pointPosition.y + pointToAdd.y * evaluateVal
-        pointPosition.z = pointPosition.z + pointToAdd.z * evaluateVal
+        numPoints = geoIterator.count()
+        if numPoints == 0:
+            return
+
+        mScriptUtil, pointsPtr, pointsView = pointArrayBuffer(numPoints)
+
+        if inMesh.hasFn(om.MFn.kMesh) and om.MFnMesh(inMesh).numVertices() == numPoints:
+            # the deformer affects every vertex, read the mesh's float point buffer directly
+            rawPoints = om.MFnMesh(inMesh).getRawPoints()
+            positions = np.ctypeslib.as_array((ctypes.c_float * (3 * numPoints)).from_address(int(rawPoints)))
+            positions = positions.reshape(numPoints, 3)
+            pointsView[:, :3] = positions
+            pointsView[:, 3] = 1.0
+        else:
+            # read all point positions at once, and copy them into the double4 buffer
+            mPointArray_meshVert = om.MPointArray()
+            geoIterator.allPositions(mPointArray_meshVert)
+            mPointArray_meshVert.get(pointsPtr)
+            positions = pointsView
+
+        # x and z are the only coordinates the waves depend on,
+        # copy them once out of the interleaved points into contiguous float arrays
+        xs = np.ascontiguousarray(positions[:, 0], dtype=np.float32)
+        zs = np.ascontiguousarray(positions[:, 2], dtype=np.float32)
+
+        offsetX = np.zeros(numPoints, dtype=np.float32)
+        offsetY = np.zeros(numPoints, dtype=np.float32)
+        offsetZ = np.zeros(numPoints, dtype=np.float32)
+
+        # the per-wave values combined with movement and envelope, in float32 like the points,
+        # the waves are evaluated in float32 and only widened when added to the double positions
+        params = np.array([waveParams(waveConstant, movementVal, envelopeVal) for waveConstant in constants],
+                          dtype=np.float32)
+
+        if gerstnerGpu is not None and numPoints >= gpuMinPoints:
+            # GPU kernel, upload x and z, evaluate the waves on the device and download the offsets
+            offsetsGpu = gerstnerGpu(cupy.asarray(xs), cupy.asarray(zs), cupy.asarray(params.ravel()),
+                                     block_size=gpuBlockSize)
+            offsetsGpu[0].get(out=offsetX)
+            offsetsGpu[1].get(out=offsetY)
+            offsetsGpu[2].get(out=offsetZ)
+        elif gerstnerSimd is not None:
+            # native kernel
+            gerstnerSimd.gerstnerApplyWaves(xs.ctypes.data, zs.ctypes.data, offsetX.ctypes.data,
+                                            offsetY.ctypes.data, offsetZ.ctypes.data, numPoints, params.ctypes.data)
+        elif applyThreeWaves is not None:
+            # compiled kernel, multi-threaded for large meshes
+            kernel = applyThreeWaves if numPoints >= parallelMinPoints else applyThreeWavesSerial
+            kernel(xs, zs, params, offsetX, offsetY, offsetZ)
+        else:
+            gerstnerWavesNumPy(xs, zs, params, offsetX, offsetY, offsetZ)
+
+        # add the wave offsets back into the interleaved positions and set all point positions at once.
+        pointsView[:, 0] += offsetX
+        pointsView[:, 1] += offsetY
+        pointsView[:, 2] += offsetZ
+        geoIterator.setAllPositions(om.MPointArray(pointsPtr, numPoints))
 
 
     def deform(self, dataBlock, geoIterator, matrix, geometryIndex):
@@ -150,21 +499,46 @@ class Ripple(omMPx.MPxDeformerNode):
         dataHandleWaveC_Wavelength = dataBlock.inputValue(Ripple.mObj_inWaveC_Wavelength)
         waveC_WavelengthVal = dataHandleWaveC_Wavelength.asFloat()
 
-        # create mPointArray to append all pointPositions and use to set all point positions at once.
+        # values that do not depend on the vertex position, computed once per wave
+        waveConstantsA = self.cachedWaveConstants(waveA_DirStpVal, waveA_WavelengthVal)
+        waveConstantsB = self.cachedWaveConstants(waveB_DirStpVal, waveB_WavelengthVal)
+        waveConstantsC = self.cachedWaveConstants(waveC_DirStpVal, waveC_WavelengthVal)
+
+        if np is not None:
+            self.deformVectorized(geoIterator, inMesh, [waveConstantsA, waveConstantsB, waveConstantsC], movementVal, envelopeVal)
+            return
+
+        waveParamsA = waveParams(waveConstantsA, movementVal, envelopeVal)
+        waveParamsB = waveParams(waveConstantsB, movementVal, envelopeVal)
+        waveParamsC = waveParams(waveConstantsC, movementVal, envelopeVal)
+
+        # create mPointArray sized for all points, to set all point positions at once,
+        # filled by index so it is never reallocated while growing.
+        numPoints = geoIterator.count()
         mPointArray_meshVert = om.MPointArray()
+        mPointArray_meshVert.setLength(numPoints)
+        pointIndex = 0
         # use geoIterators to iterate over mesh data
 
         while not geoIterator.isDone():
 
+            # work on plain floats, only one MPoint is created per vertex
             pointPosition = geoIterator.position()
-
-            # add gerstnerWave result to pointPosition for each of the 3 waves.
-            self.addToPosition(pointPosition, self.gerstnerWave(waveA_DirStpVal, waveA_WavelengthVal, pointPosition, movementVal), envelopeVal)
-            self.addToPosition(pointPosition, self.gerstnerWave(waveB_DirStpVal, waveB_WavelengthVal, pointPosition, movementVal), envelopeVal)
-            self.addToPosition(pointPosition, self.gerstnerWave(waveC_DirStpVal, waveC_WavelengthVal, pointPosition, movementVal), envelopeVal)
-            
-            # append new poisiton to MPointArray
-            mPointArray_meshVert.append(pointPosition)
+            px = pointPosition.x
+            py = pointPosition.y
+            pz = pointPosition.z
+
+            # evaluate all 3 waves at the original point position, as in the reference algorithm
+            oxA, oyA, ozA = self.gerstnerWave(px, pz, *waveParamsA)
+            oxB, oyB, ozB = self.gerstnerWave(px, pz, *waveParamsB)
+            oxC, oyC, ozC = self.gerstnerWave(px, pz, *waveParamsC)
+
+            # set new poisiton, with the sum of the 3 waves added, in MPointArray (no MPoint created)
+            mPointArray_meshVert.set(pointIndex,
+                                     px + oxA + oxB + oxC,
+                                     py + oyA + oyB + oyC,
+                                     pz + ozA + ozB + ozC)
+            pointIndex += 1
             geoIterator.next()
 
         # optimize by setting all point positions at once.
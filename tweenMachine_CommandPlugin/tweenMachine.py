@@ -22,6 +22,15 @@ Run Command:
 1. Use Maya.cmds directly to run this command
     maya.cmds.tweenMachine(weight=20.0)
 2. Use the interactive UI (tweenMachine.py) (Recommended)
+
+Interactive Drag Commands (used by the UI slider):
+tweenMachinePrepare : finds the keys around the current time on the selected animation curves
+                      once, when the slider is pressed.
+tweenMachineApply -w : sets the new key values from the prepared keys while the slider is dragged,
+                       without searching the curves again. These changes are not undoable,
+                       they are reverted when the tweenMachine command sets the final value.
+applyDragWeight(weight) : module function doing the same as tweenMachineApply, called directly by
+                          the UI to skip the command's argument parsing on every slider change.
 """
 
 import maya.OpenMaya as om
@@ -31,6 +40,8 @@ import sys
 
 
 commandName = "tweenMachine"
+prepareCommandName = "tweenMachinePrepare"
+applyCommandName = "tweenMachineApply"
 
 # define variables for command flags
 kHelpFlag = "-h" # help flag
@@ -41,13 +52,126 @@ kWeightLongFlag = "-weight"
 
 helpMessage = "This command is used to add a key at the current time frame between 2 existing keys, with weigth input defining the value of the key"
 
+
+class tweenDragSession(object):
+
+    """
+    Keys found by the tweenMachinePrepare command when the UI slider is pressed,
+    used by the tweenMachineApply command while the slider is dragged.
+    """
+
+    def __init__(self, currTime):
+        self.currTime = currTime
+        # one [anim curve MObject, index of key at current time (None until added), prev key value, next key value,
+        # new key in-tangent, new key out-tangent] list per animation curve
+        self.keys = []
+        # records the keys added or changed during the drag, so they can be reverted
+        self.mAnimCurveChangeCache = omA.MAnimCurveChange()
+
+    def apply(self, weight):
+
+        """
+        Method to set the value of the key at the current time on all prepared animation curves,
+        adding the key on the first call.
+
+        Parameters:
+        weight (float) : weight between 0 and 1
+        """
+
+        mFnAnimCurve = omA.MFnAnimCurve()
+
+        for key in self.keys:
+            mObj, key_Ind, prev_Key_Value, next_Key_Value, new_Key_inTangent, new_Key_outTangent = key
+            mFnAnimCurve.setObject(mObj)
+            new_Key_Value = prev_Key_Value + (next_Key_Value - prev_Key_Value) * weight
+
+            if key_Ind is None:
+                key[1] = mFnAnimCurve.addKey(self.currTime, new_Key_Value, new_Key_inTangent, new_Key_outTangent, self.mAnimCurveChangeCache)
+            else:
+                mFnAnimCurve.setValue(key_Ind, new_Key_Value, self.mAnimCurveChangeCache)
+
+    def revert(self):
+
+        # undo all keys added or changed during the drag
+        self.mAnimCurveChangeCache.undoIt()
+
+
+# drag session of the UI slider, created by tweenMachinePrepare
+dragSession = None
+
+# set when Maya loads this module as the plugin, so the UI can tell it apart from another import of the file
+pluginLoaded = False
+
+# (selection key, MObjectArray of animation curves) found for the last selection,
+# cleared by the plugin's callbacks when the selection or the scene's animation curves change
+animCurveCache = None
+# ids of the callbacks clearing animCurveCache, removed when the plugin is unloaded
+callbackIds = None
+
+
+def endDragSession():
+
+    """
+    Function to revert the changes of the current drag session, if any, and end it.
+    The final value of the drag is set by the (undoable) tweenMachine command.
+    """
+
+    global dragSession
+    if dragSession is not None:
+        dragSession.revert()
+        dragSession = None
+
+
+def selectionKey(mSel):
+
+    """
+    Function to build a key identifying the nodes of a selection list, used for animCurveCache
+
+    Parameters:
+    mSel (MSelectionList) : Active Selection List
+    """
+
+    mObj = om.MObject()
+    nodeHashes = []
+    for i in range(mSel.length()):
+        mSel.getDependNode(i, mObj)
+        nodeHashes.append(om.MObjectHandle(mObj).hashCode())
+    return tuple(nodeHashes)
+
+
+def clearAnimCurveCache(*args):
+
+    # callback for selection changes and animation curves being created, deleted or (dis)connected
+    global animCurveCache
+    animCurveCache = None
+
+
+def applyDragWeight(weight):
+
+    """
+    Function to set the key values of the current drag session from the weight input,
+    without going through the tweenMachineApply command and its argument parsing.
+
+    Parameters:
+    weight (float) : weight value between 0 and 100
+    """
+
+    if weight > 100.0 or weight < 0.0:
+        om.MGlobal.displayError("Weight value is required. Should be Between 0.0 - 100.0")
+    elif dragSession is not None:
+        dragSession.apply(weight / 100.0)
+
+
 class tweenMachinePlugin(omMPx.MPxCommand):
     # define member variables for flag arguments
     weight = None
-    mAnimCurveChangeCache = omA.MAnimCurveChange()
+    currTime = None
+    mAnimCurveChangeCache = None
 
     def __init__(self):
         omMPx.MPxCommand.__init__(self)
+        # each command instance records its own changes, so undo only reverts this command
+        self.mAnimCurveChangeCache = omA.MAnimCurveChange()
         
     def argumentParser(self, argList):
         
@@ -95,34 +219,35 @@ class tweenMachinePlugin(omMPx.MPxCommand):
         # if no curves are selected, check if a DAG Node is selected.
         if mObjArray_Anim.length() <= 0:
             mItSelectionList = om.MItSelectionList(mSel, om.MFn.kDagNode)
+
+            # created once and reused for every selected node and animated plug
+            mObj = om.MObject()
+            mPlugArray_animated = om.MPlugArray()
+            mObjArray_plugAnim = om.MObjectArray()
         
             # loop through the selected DAG Nodes
             while not mItSelectionList.isDone():
-                mObj = om.MObject()
                 mItSelectionList.getDependNode(mObj)
                 
                 # if the selected object is animated
                 if omA.MAnimUtil.isAnimated(mObj, False): 
                     
                     # get all plugs
-                    mPlugArray_animated = om.MPlugArray()
+                    mPlugArray_animated.clear()
                     omA.MAnimUtil.findAnimatedPlugs(mObj, mPlugArray_animated, False)
                 
                     for i in range(mPlugArray_animated.length()):
-                        # Loop through each plug of the selected item and get all of it's connections
-                        mPlugArray2 = om.MPlugArray()
-                        mPlugArray_animated[i].connectedTo(mPlugArray2, True, True)
-                        
-                        # loop through each connection for the current plug
-                        for j in range(mPlugArray2.length()):  
-                            # if the connection's node is an animation curve, add it to the mObjArray_Anim list
-                            if "kAnimCurve" in mPlugArray2[j].node().apiTypeStr():
-                                mObjArray_Anim.append(mPlugArray2[j].node())
+                        # let Maya find the animation curves driving each plug of the selected item,
+                        # instead of checking the type name of each of it's connections
+                        mObjArray_plugAnim.clear()
+                        if omA.MAnimUtil.findAnimation(mPlugArray_animated[i], mObjArray_plugAnim):
+                            for j in range(mObjArray_plugAnim.length()):
+                                mObjArray_Anim.append(mObjArray_plugAnim[j])
                 
                 mItSelectionList.next()
 
 
-    def addKeyToAnimCurves(self, mObjArray_Anim, currTime):
+    def addKeyToAnimCurves(self, mObjArray_Anim, currTime, weight):
         """
         Method to loop through all animation curves and add keys on the current time frame according to weight input.
 
@@ -130,26 +255,44 @@ class tweenMachinePlugin(omMPx.MPxCommand):
         mObjArray_Anim (MObjArray) : array of animation curves MObjects extracted from the selected objects in the Maya scene
         (results from self.getAnimationCurves() method)
         curreTime (MTime) : Current Time on the Time slider in Maya
+        weight (float) : weight input remapped to be between 0 and 1
         """
         mFnAnimCurve = omA.MFnAnimCurve()
 
+        # bind attributes used in the loop to locals, to look them up once instead of once per curve
+        kTangentFixed = omA.MFnAnimCurve.kTangentFixed
+        globalInTangentType = omA.MAnimControl.globalInTangentType
+        globalOutTangentType = omA.MAnimControl.globalOutTangentType
+        setObject = mFnAnimCurve.setObject
+        numKeys = mFnAnimCurve.numKeys
+        isTimeInput = mFnAnimCurve.isTimeInput
+        findClosest = mFnAnimCurve.findClosest
+        keyTime = mFnAnimCurve.time
+        keyValue = mFnAnimCurve.value
+        inTangentType = mFnAnimCurve.inTangentType
+        outTangentType = mFnAnimCurve.outTangentType
+        addKey = mFnAnimCurve.addKey
+        setValue = mFnAnimCurve.setValue
+        oneMinusWeight = 1.0 - weight
+        animCurveChange = self.mAnimCurveChangeCache
+
         for i in range(mObjArray_Anim.length()):
 
-            mFnAnimCurve.setObject(mObjArray_Anim[i])
-            numKeys = mFnAnimCurve.numKeys()
+            setObject(mObjArray_Anim[i])
+            lastKeyInd = numKeys() - 1
 
             # if curve is Time Input, we can set a new keyframe
-            if mFnAnimCurve.isTimeInput():
+            if isTimeInput():
                 
                 # find the index of the key closest to the current time
-                closest_ind = mFnAnimCurve.findClosest(currTime)
+                closest_ind = findClosest(currTime)
                 # find the time that the closest key is set at
-                closest_Time = mFnAnimCurve.time(closest_ind)
+                closest_Time = keyTime(closest_ind)
                 
                 # if no key exists at current time, add a new key
                 if closest_Time != currTime:
                     # set previous and next key indices
-                    if closest_Time < currTime and closest_ind < numKeys-1:
+                    if closest_Time < currTime and closest_ind < lastKeyInd:
                         prev_Key_Ind = closest_ind
                         next_Key_Ind = closest_ind + 1
                     elif closest_Time > currTime and closest_ind > 0:
@@ -161,47 +304,59 @@ class tweenMachinePlugin(omMPx.MPxCommand):
                         break
                 
                     # set in and out tangent types for new key based on prev and next keys   
-                    new_Key_inTangent = mFnAnimCurve.outTangentType(prev_Key_Ind) # prev key's out-tangent is new key's in-tangent        
-                    new_Key_outTangent = mFnAnimCurve.inTangentType(next_Key_Ind) # next key's in-tangent is new key's out-tangent
+                    new_Key_inTangent = outTangentType(prev_Key_Ind) # prev key's out-tangent is new key's in-tangent        
+                    new_Key_outTangent = inTangentType(next_Key_Ind) # next key's in-tangent is new key's out-tangent
 
                     # if new in and out tangents are "fixed" type, set then as them global in and out tangent types
-                    if new_Key_inTangent == omA.MFnAnimCurve.kTangentFixed or new_Key_outTangent == omA.MFnAnimCurve.kTangentFixed:
-                        new_Key_inTangent = omA.MAnimControl.globalInTangentType()
-                        new_Key_outTangent = omA.MAnimControl.globalOutTangentType()
+                    if new_Key_inTangent == kTangentFixed or new_Key_outTangent == kTangentFixed:
+                        new_Key_inTangent = globalInTangentType()
+                        new_Key_outTangent = globalOutTangentType()
                     
                     # evaluate value of the new key based on the weight input (provided from the UI slider)
-                    new_Key_Value = (mFnAnimCurve.value(prev_Key_Ind) * (1-self.weight)) + (mFnAnimCurve.value(next_Key_Ind) * self.weight)
+                    new_Key_Value = (keyValue(prev_Key_Ind) * oneMinusWeight) + (keyValue(next_Key_Ind) * weight)
 
                     # add a new key and store operation in anim curve change cache to allow undo
-                    mFnAnimCurve.addKey(currTime, new_Key_Value, new_Key_inTangent, new_Key_outTangent, self.mAnimCurveChangeCache)
+                    addKey(currTime, new_Key_Value, new_Key_inTangent, new_Key_outTangent, animCurveChange)
 
                 # if key exists at current time, update it's value (required when UI slider is pressed and value is changes till it's released)
                 else:
                     # closest_ind is the index of the key at current time
-                    new_Key_Value = (mFnAnimCurve.value(closest_ind-1) * (1-self.weight)) + (mFnAnimCurve.value(closest_ind+1) * self.weight)
-                    mFnAnimCurve.setValue(closest_ind,new_Key_Value)
+                    new_Key_Value = (keyValue(closest_ind-1) * oneMinusWeight) + (keyValue(closest_ind+1) * weight)
+                    # store operation in anim curve change cache to allow undo
+                    setValue(closest_ind, new_Key_Value, animCurveChange)
                 
 
-    def redoIt(self):
+    def getSelectedAnimCurves(self):
 
-        # get the current time on the Time Slider
-        currTime = omA.MAnimControl.currentTime()
-        # remap weight value to be between 0 and 1
-        self.weight/=100.0
+        """
+        Method to get the animation curves of the currently selected objects in the Maya Scene
+
+        Returns:
+        MObjectArray of animation curves, or None (after displaying an error) if there are none
+        """
+        global animCurveCache
 
         # get the active selection list
         mSel = om.MSelectionList()
         om.MGlobal.getActiveSelectionList(mSel)
 
         if not mSel.isEmpty():
+            mSelKey = selectionKey(mSel)
+
+            # reuse the animation curves found for the same selection, if they all still exist
+            if animCurveCache is not None and animCurveCache[0] == mSelKey:
+                mObjArray_Anim = animCurveCache[1]
+                if all(om.MObjectHandle(mObjArray_Anim[i]).isValid() for i in range(mObjArray_Anim.length())):
+                    return mObjArray_Anim
+
             mItSelectionList = om.MItSelectionList(mSel, om.MFn.kAnimCurve)
             mObjArray_Anim = om.MObjectArray()
 
             # get the animation curves from the currently selected objects.
             self.getAnimCurves(mSel, mItSelectionList, mObjArray_Anim)
             if mObjArray_Anim.length() > 0:
-                # add keyframe to those animation curves
-                self.addKeyToAnimCurves(mObjArray_Anim, currTime)
+                animCurveCache = (mSelKey, mObjArray_Anim)
+                return mObjArray_Anim
             else:
                 # if nothing is animated, throw error
                 om.MGlobal.displayError("No animated object selected")
@@ -210,6 +365,20 @@ class tweenMachinePlugin(omMPx.MPxCommand):
             # if nothing is selected, throw error
             om.MGlobal.displayError("No DAG Object or Anim Curve Slected")
 
+        return None
+
+
+    def redoIt(self):
+
+        # remap weight value to be between 0 and 1, without changing the parsed flag value,
+        # so calling redoIt again (redo) uses the same weight
+        weight = self.weight / 100.0
+
+        mObjArray_Anim = self.getSelectedAnimCurves()
+        if mObjArray_Anim is not None:
+            # add keyframe to those animation curves, at the time the command was run
+            self.addKeyToAnimCurves(mObjArray_Anim, self.currTime, weight)
+
 
     def isUndoable(self):
         return True
@@ -227,16 +396,121 @@ class tweenMachinePlugin(omMPx.MPxCommand):
     
         # if weight variable has value, call redoIt
         if self.weight != None and self.weight <= 100.0 and self.weight >= 0.0:
+            # revert the UI slider drag, this command sets the final value in an undoable way
+            endDragSession()
+            # get the current time on the Time Slider once, redo keys the same frame
+            self.currTime = omA.MAnimControl.currentTime()
             self.redoIt()
         else:
             # if nothing is selected, throw error
             om.MGlobal.displayError("Weight value is required. Should be Between 0.0 - 100.0")
 
 
+class tweenMachinePreparePlugin(tweenMachinePlugin):
+
+    """
+    Command run when the UI slider is pressed. Finds the previous and next keys of the selected
+    animation curves once, and stores them in a new drag session for tweenMachineApply.
+    """
+
+    def isUndoable(self):
+        # the scene is not changed
+        return False
+
+
+    def doIt(self, argList):
+        global dragSession
+
+        # revert a previous drag that was not finished with the tweenMachine command
+        endDragSession()
+
+        # get the current time on the Time Slider
+        currTime = omA.MAnimControl.currentTime()
+
+        mObjArray_Anim = self.getSelectedAnimCurves()
+        if mObjArray_Anim is None:
+            return
+
+        session = tweenDragSession(currTime)
+        mFnAnimCurve = omA.MFnAnimCurve()
+
+        for i in range(mObjArray_Anim.length()):
+
+            mFnAnimCurve.setObject(mObjArray_Anim[i])
+
+            # only Time Input curves can get a new keyframe
+            if not mFnAnimCurve.isTimeInput():
+                continue
+
+            closest_ind = mFnAnimCurve.findClosest(currTime)
+            closest_Time = mFnAnimCurve.time(closest_ind)
+
+            # set previous and next key indices, and the index of the key at current time if it exists
+            key_Ind = None
+            if closest_Time == currTime:
+                key_Ind = closest_ind
+                prev_Key_Ind = closest_ind - 1
+                next_Key_Ind = closest_ind + 1
+            elif closest_Time < currTime:
+                prev_Key_Ind = closest_ind
+                next_Key_Ind = closest_ind + 1
+            else:
+                prev_Key_Ind = closest_ind - 1
+                next_Key_Ind = closest_ind
+
+            if prev_Key_Ind < 0 or next_Key_Ind > mFnAnimCurve.numKeys() - 1:
+                # if the selected time frame does not lie between two existing keyframes, throw error and break
+                om.MGlobal.displayError("Previous or Next keyframe does not exist for this time for at least one of the animation curves.")
+                break
+
+            # set in and out tangent types for new key based on prev and next keys
+            new_Key_inTangent = mFnAnimCurve.outTangentType(prev_Key_Ind)
+            new_Key_outTangent = mFnAnimCurve.inTangentType(next_Key_Ind)
+            if new_Key_inTangent == omA.MFnAnimCurve.kTangentFixed or new_Key_outTangent == omA.MFnAnimCurve.kTangentFixed:
+                new_Key_inTangent = omA.MAnimControl.globalInTangentType()
+                new_Key_outTangent = omA.MAnimControl.globalOutTangentType()
+
+            session.keys.append([om.MObject(mObjArray_Anim[i]), key_Ind,
+                                 mFnAnimCurve.value(prev_Key_Ind), mFnAnimCurve.value(next_Key_Ind),
+                                 new_Key_inTangent, new_Key_outTangent])
+
+        dragSession = session
+
+
+class tweenMachineApplyPlugin(tweenMachinePlugin):
+
+    """
+    Command run while the UI slider is dragged. Sets the key values of the drag session
+    prepared by tweenMachinePrepare from the weight input, without searching the curves again.
+    """
+
+    def isUndoable(self):
+        # changes are reverted, and set again by the undoable tweenMachine command when the drag ends
+        return False
+
+
+    def doIt(self, argList):
+        # parse the argument list
+        self.argumentParser(argList)
+
+        if self.weight == None:
+            om.MGlobal.displayError("Weight value is required. Should be Between 0.0 - 100.0")
+        else:
+            applyDragWeight(self.weight)
+
+
 def commandCreator():
     return omMPx.asMPxPtr(tweenMachinePlugin())
 
 
+def prepareCommandCreator():
+    return omMPx.asMPxPtr(tweenMachinePreparePlugin())
+
+
+def applyCommandCreator():
+    return omMPx.asMPxPtr(tweenMachineApplyPlugin())
+
+
 def syntaxCreator():
     
     # create MSyntax object
@@ -251,20 +525,39 @@ def syntaxCreator():
 
 # funtion for initialization of the plugin
 def initializePlugin(monject):
+    global pluginLoaded, callbackIds
     
     mplugin = omMPx.MFnPlugin(monject, "Rashi Sinha", "1.0")
     try:   
         mplugin.registerCommand(commandName, commandCreator, syntaxCreator)
+        mplugin.registerCommand(prepareCommandName, prepareCommandCreator)
+        mplugin.registerCommand(applyCommandName, applyCommandCreator, syntaxCreator)
+        pluginLoaded = True
+
+        # invalidate the cached animation curves of the selection
+        callbackIds = om.MCallbackIdArray()
+        callbackIds.append(om.MEventMessage.addEventCallback("SelectionChanged", clearAnimCurveCache))
+        callbackIds.append(om.MDGMessage.addNodeAddedCallback(clearAnimCurveCache, "animCurve"))
+        callbackIds.append(om.MDGMessage.addNodeRemovedCallback(clearAnimCurveCache, "animCurve"))
+        callbackIds.append(om.MDGMessage.addConnectionCallback(clearAnimCurveCache))
     except:
         # show error if plugin couldn't be registered  
         sys.stderr.write("Failed to register command: ", commandName)
         
 # funtion for Un-initialization of the plugin
 def uninitializePlugin(monject):
+    global pluginLoaded, callbackIds
 
+    pluginLoaded = False
+    if callbackIds is not None:
+        om.MMessage.removeCallbacks(callbackIds)
+        callbackIds = None
+    clearAnimCurveCache()
     mplugin = omMPx.MFnPlugin(monject)
     try:
         mplugin.deregisterCommand(commandName)
+        mplugin.deregisterCommand(prepareCommandName)
+        mplugin.deregisterCommand(applyCommandName)
     except:
         # show error if plugin couldn't be registered
         sys.stderr.write("Failed to de-register command: ", commandName)
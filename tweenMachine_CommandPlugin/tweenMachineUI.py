@@ -16,6 +16,7 @@ Open the script in script editor in Maya
     2. (Recommended) Save script to custom shelf, save shelf and click on the custom shelf icon
 """
 
+import sys
 from maya import OpenMayaUI as omui 
 import maya.cmds as cmds
 try:
@@ -32,6 +33,13 @@ except ImportError:
     from PySide import __version__
     from shiboken import wrapInstance 
 
+def tweenMachinePluginModule():
+    # the tweenMachine.py module loaded by Maya as the plugin, to call its functions directly
+    plugin = sys.modules.get("tweenMachine")
+    if plugin is not None and getattr(plugin, "pluginLoaded", False):
+        return plugin
+    return None
+
 def maya_main_window():
     main_window_ptr = omui.MQtUtil.mainWindow()
     return wrapInstance(int(main_window_ptr), QWidget)
@@ -45,6 +53,14 @@ class TweenMainWindow(QMainWindow):
 
         self.sliderPressedBool = False
         self.sliderReleasedBool = True
+        # last weight applied while dragging the slider, set by the tweenMachine command on release
+        self.dragWeightVal = None
+        # weight waiting to be applied, slider changes are applied at most once per frame (16 ms)
+        self.pendingWeightVal = None
+        self.applyTimer = QTimer(self)
+        self.applyTimer.setSingleShot(True)
+        self.applyTimer.setInterval(16)
+        self.applyTimer.timeout.connect(self.applyPendingWeight)
         
         # add UI Elements
         self.setWindowTitle("Tween Machine - v1.0")
@@ -86,17 +102,55 @@ class TweenMainWindow(QMainWindow):
         weightVal = self.tweenSlider.value()
         if self.sliderPressedBool and not self.sliderReleasedBool:
             self.pLabel2.setText(str(weightVal))
-            cmds.tweenMachine(weight = weightVal)
+            # apply the latest value when the timer runs out, skipping the values in between
+            self.pendingWeightVal = weightVal
+            if not self.applyTimer.isActive():
+                self.applyTimer.start()
+
+
+    def applyPendingWeight(self):
+        if self.pendingWeightVal is None:
+            return
+        weightVal = self.pendingWeightVal
+        self.pendingWeightVal = None
+
+        # only set the key values found when the slider was pressed,
+        # with viewport refresh suspended until all curves are set
+        cmds.refresh(suspend = True)
+        try:
+            plugin = tweenMachinePluginModule()
+            if plugin is not None:
+                # call the plugin directly, skipping the command's argument parsing
+                plugin.applyDragWeight(weightVal)
+            else:
+                cmds.tweenMachineApply(weight = weightVal)
+        finally:
+            cmds.refresh(suspend = False)
+        self.dragWeightVal = weightVal
 
 
     def sliderPressed(self):
         self.sliderPressedBool = True
         self.sliderReleasedBool = False
+        self.dragWeightVal = None
+        self.pendingWeightVal = None
+        # find the keys around the current time once for the whole drag
+        cmds.tweenMachinePrepare()
 
 
     def sliderReleased(self):
         self.sliderPressedBool = False
         self.sliderReleasedBool = True
+        # the final value may still be waiting for the timer
+        self.applyTimer.stop()
+        if self.pendingWeightVal is not None:
+            self.dragWeightVal = self.pendingWeightVal
+            self.pendingWeightVal = None
+
+        # set the final value with the undoable command
+        if self.dragWeightVal is not None:
+            cmds.tweenMachine(weight = self.dragWeightVal)
+            self.dragWeightVal = None
 
 
 def showTweenWindow():